@@ -0,0 +1,112 @@
+"""
+混合模式出題比較：原本的「抽題 + 每題 random.choice 問法」vs compose_mixed_round()
+
+  python bench_round_composer.py
+  python bench_round_composer.py --sizes 30 1000 1000000 --games 300
+
+每種題庫大小模擬同一位學生連玩 --games 局（每局最多 3 回合、每回合 10 題，
+和網頁一樣全對才進下一回合；各問法答對率不同），統計：
+  - 問法不平均：某回合三種問法題數相差超過 1
+  - 同題同問法重複：(題, 問法) 和前面回合重複
+  - 弱項沒優先：正確率最低的問法（之前幾局 + 這一局）沒拿到最多題
+  - 每回合出題平均耗時
+"""
+import argparse
+import random
+import time
+
+from question_bank import SUBMODES, compose_mixed_round, pick_round_items
+
+MAX_ROUNDS = 3
+QUESTIONS_PER_ROUND = 10
+
+
+def legacy_round(available, k, history, rng, past_stats):
+    chosen = pick_round_items(available, k, rng)
+    return chosen, [rng.choice(SUBMODES) for _ in chosen]
+
+
+def composed_round(available, k, history, rng, past_stats):
+    return compose_mixed_round(available, k, history, rng, past_stats)
+
+
+def weakest_submodes(history, past_stats):
+    """正確率最低（沒作答過算最低）的問法集合"""
+    acc = {}
+    for sm in SUBMODES:
+        answered, correct = past_stats[sm]
+        res = [ok for _, s, ok in history if s == sm]
+        answered += len(res)
+        correct += sum(res)
+        acc[sm] = correct / answered if answered else -1.0
+    low = min(acc.values())
+    return {sm for sm, a in acc.items() if a == low}
+
+
+def simulate(composer, bank_size, games, seed):
+    rng = random.Random(seed)
+    skill = {sm: rng.uniform(0.5, 0.95) for sm in SUBMODES}
+    stats = {"rounds": 0, "unbalanced": 0, "repeated_pairs": 0, "weak_not_covered": 0}
+    elapsed = 0.0
+    past_stats = {sm: (0, 0) for sm in SUBMODES}
+
+    for _ in range(games):
+        history = []
+        used = set()
+        for _ in range(MAX_ROUNDS):
+            # 和網頁一樣：用過的題先排除，用完才重置
+            available = [i for i in range(bank_size) if i not in used]
+            if not available:
+                used = set()
+                available = list(range(bank_size))
+
+            t0 = time.perf_counter()
+            chosen, submodes = composer(available, QUESTIONS_PER_ROUND, history, rng, past_stats)
+            elapsed += time.perf_counter() - t0
+
+            counts = {sm: submodes.count(sm) for sm in SUBMODES}
+            seen_pairs = {(q, s) for q, s, _ in history}
+            stats["rounds"] += 1
+            stats["unbalanced"] += max(counts.values()) - min(counts.values()) > 1
+            stats["repeated_pairs"] += sum((q, s) in seen_pairs for q, s in zip(chosen, submodes))
+            if len(chosen) % len(SUBMODES):
+                top = max(counts.values())
+                stats["weak_not_covered"] += not any(
+                    counts[sm] == top for sm in weakest_submodes(history, past_stats)
+                )
+
+            round_results = []
+            for qidx, sm in zip(chosen, submodes):
+                round_results.append((qidx, sm, rng.random() < skill[sm]))
+                used.add(qidx)
+            history.extend(round_results)
+            if not all(ok for _, _, ok in round_results):
+                break
+
+        for _, sm, ok in history:
+            answered, correct = past_stats[sm]
+            past_stats[sm] = (answered + 1, correct + (1 if ok else 0))
+
+    stats["ms_per_round"] = elapsed / stats["rounds"] * 1000
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="混合模式出題：原做法 vs 平衡出題")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12, 30, 1000, 100000])
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'題庫':>8} {'做法':<8} {'回合':>6} {'不平均':>6} {'重複配對':>8} {'弱項沒優先':>10} {'ms/回合':>8}")
+    for size in args.sizes:
+        for label, composer in (("legacy", legacy_round), ("composer", composed_round)):
+            st = simulate(composer, size, args.games, args.seed)
+            print(
+                f"{size:>8} {label:<8} {st['rounds']:>6} {st['unbalanced']:>6} "
+                f"{st['repeated_pairs']:>8} {st['weak_not_covered']:>10} {st['ms_per_round']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,28 @@
 import streamlit as st
-import random
 import uuid
+import os
+import time
+import logging
+import hashlib
+import hmac
+import struct
+import atexit
+import bisect
+import sqlite3
+import threading
 import pandas as pd
 
+from question_bank import (
+    BANK_ISSUE_LABELS,
+    SUBMODES,
+    answer_field,
+    build_options,
+    compose_mixed_round,
+    pick_round_items,
+    question_prompt_text,
+    read_question_bank,
+)
+
 # ====== App 基本設定 ======
 st.set_page_config(
     page_title="Chem / Element Practice",
@@ -131,94 +151,33 @@ div[data-testid="stVerticalBlock"] > div:has(> div[data-testid="stRadio"]) {
 
 
 # ===================== 題庫載入（容錯版，這次抓 name / english / symbol） =====================
-@st.cache_data
+@st.cache_resource
 def load_question_bank(xlsx_path="element_app.xlsx"):
     """
-    嘗試讀取 Excel 並自動對應三欄：
-      name    -> 可能: Name, 中文, 名稱, Chinese, CN
-      english -> 可能: English, 英文, Term, 英文名, EN, English term
-      symbol  -> 可能: Symbol, 符號, 元素符號, abbrev, 符號Symbol, 符號/代號, symbol(en)
-
-    回傳:
-    {
-      "ok": bool,
-      "error": str,
-      "bank": [ { "name":..., "english":..., "symbol":...}, ... ],
-      "debug_cols": [...]
-    }
+    讀取 / 檢查題庫的細節見 question_bank.read_question_bank()。
+    用 cache_resource：每次 rerun 拿到的是同一份物件，不會像 cache_data 每次都複製整個題庫。
+    題庫與檢查報告都只讀不改。
     """
-    try:
-        df = pd.read_excel(xlsx_path)
-    except Exception as e:
-        return {
-            "ok": False,
-            "error": f"無法讀取題庫檔案 {xlsx_path} ：{e}",
-            "bank": [],
-            "debug_cols": []
-        }
-
-    def norm(s):
-        return str(s).strip().lower()
-
-    cols_norm = {norm(c): c for c in df.columns}
-
-    name_candidates = ["name", "中文", "名稱", "chinese", "cn"]
-    eng_candidates  = ["english", "英文", "term", "英文名", "en", "english term"]
-    sym_candidates  = ["symbol", "符號", "元素符號", "符號symbol", "abbrev", "代號", "符號/代號"]
-
-    def pick_col(cands):
-        for cand in cands:
-            if cand in cols_norm:
-                return cols_norm[cand]
-        return None
-
-    name_col = pick_col(name_candidates)
-    eng_col  = pick_col(eng_candidates)
-    sym_col  = pick_col(sym_candidates)
-
-    if name_col is None or eng_col is None or sym_col is None:
-        return {
-            "ok": False,
-            "error": (
-                "找不到必要欄位。\n"
-                f"目前檔案欄位是：{list(df.columns)}\n"
-                f"Name欄候選：{name_candidates}\n"
-                f"English欄候選：{eng_candidates}\n"
-                f"Symbol欄候選：{sym_candidates}\n"
-                "請把 Excel 欄位命名成其中一個候選名稱（例如：Name / English / Symbol）。"
-            ),
-            "bank": [],
-            "debug_cols": list(df.columns)
-        }
-
-    def clean(x):
-        if pd.isna(x):
-            return ""
-        return str(x).strip()
-
-    bank_list = []
-    for _, row in df.iterrows():
-        nm = clean(row.get(name_col, ""))
-        en = clean(row.get(eng_col, ""))
-        sy = clean(row.get(sym_col, ""))
-        if nm and en and sy:
-            bank_list.append({
-                "name": nm,
-                "english": en,
-                "symbol": sy,
-            })
-
-    return {
-        "ok": True,
-        "error": "",
-        "bank": bank_list,
-        "debug_cols": list(df.columns)
-    }
+    return read_question_bank(xlsx_path)
 
 loaded = load_question_bank()
 QUESTION_BANK = loaded["bank"]
 
-if not loaded["ok"] or not QUESTION_BANK:
+# 題庫檢查報告頁：伺服器要設定 ELEMENT_APP_ADMIN_TOKEN，網址再帶 ?admin=<同一組 token> 才打得開
+# （題庫壞掉時也要看得到，所以不被下面的 st.stop() 擋住）
+ADMIN_TOKEN_ENV = "ELEMENT_APP_ADMIN_TOKEN"
+
+
+def is_admin_request():
+    expected = os.environ.get(ADMIN_TOKEN_ENV, "").strip()
+    given = st.query_params.get("admin", "")
+    # 沒設定 token -> 管理頁整個關閉
+    return bool(expected) and hmac.compare_digest(given.encode("utf-8"), expected.encode("utf-8"))
+
+
+IS_ADMIN_PAGE = is_admin_request()
+
+if (not loaded["ok"] or not QUESTION_BANK) and not IS_ADMIN_PAGE:
     st.error("⚠ 題庫讀取失敗或為空，請檢查 Excel 欄位。")
     st.stop()
 
@@ -240,12 +199,676 @@ SUBMODE_NAME_TO_CODE = {
     MODE_2: "eng_to_sym",
     MODE_3: "sym_to_eng",
 }
-SUBMODE_LIST_FOR_MIX = ["name_to_eng", "eng_to_sym", "sym_to_eng"]
+SUBMODE_LIST_FOR_MIX = list(SUBMODES)
+
+
+# ===================== 排行榜（各班即時排名） =====================
+LEADERBOARD_TOP_K = 10                               # 總結頁顯示前幾名
+LEADERBOARD_SIDEBAR_K = 5                            # 側邊欄顯示前幾名
+LEADERBOARD_DB_ENV = "ELEMENT_APP_LEADERBOARD_DB"   # 有設定路徑 -> 改用 SQLite（多個 worker 共用）
+
+
+def leaderboard_sort_key(rounds_cleared, correct, answered):
+    """排序鍵（越小越前面）：過關回合數 > 正確率 > 答對題數"""
+    acc = (correct / answered) if answered else 0.0
+    return (-rounds_cleared, -acc, -correct)
+
+
+def _better_stats(a, b):
+    """兩份成績 (rounds_cleared, correct, answered) 取比較好的那份；None 表示沒有"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return b if leaderboard_sort_key(*b) < leaderboard_sort_key(*a) else a
+
+
+def merge_leaderboard_stats(old_best, old_game_id, old_current, game_id, current):
+    """
+    每位學生記兩份成績：
+      best    -> 之前各局結束時（或被新的一局取代時）的最佳成績，只會變好
+      current -> 正在玩的這一局，同一局內直接覆蓋
+    換了新的一局時，上一局最後的成績先併進 best。
+    排名用兩者中比較好的那份，所以這一局中途暫時領先、最後考差，也不會蓋掉 best。
+
+    回傳 (best, current, shown)
+    """
+    best = old_best
+    if old_game_id is not None and old_game_id != game_id:
+        best = _better_stats(best, old_current)
+    return best, current, _better_stats(best, current)
+
+
+class MemoryLeaderboard:
+    """
+    同一個 process 內所有 session 共用的排行榜，依班級分組。
+      submit(): bisect 找舊/新位置是 O(log n)，但 list 的刪除/插入要搬移元素，實際是 O(n)
+                （一班幾十人，搬移的成本可以忽略）；改動碰到前段名次時，
+                另外重建一份 keep 筆的快照 tuple，O(keep)
+      top_k():  直接拿已發佈的前段快照 (tuple)，讀取不用等寫入的鎖
+    """
+
+    def __init__(self, keep=LEADERBOARD_TOP_K * 5):
+        self._lock = threading.Lock()
+        self._keep = keep            # 快照保留的名次數量
+        self._rows = {}              # user_class -> 已排序 [(sort_key, student_key), ...]
+        self._entries = {}           # (user_class, student_key) -> entry dict
+        self._published = {}         # user_class -> tuple(entry dict, ...)
+
+    def submit(self, user_class, student_key, display_name, game_id,
+               rounds_cleared, correct, answered):
+        with self._lock:
+            rows = self._rows.setdefault(user_class, [])
+            old = self._entries.get((user_class, student_key))
+            old_pos = None
+            if old is None:
+                best, current, shown = merge_leaderboard_stats(
+                    None, None, None, game_id, (rounds_cleared, correct, answered)
+                )
+            else:
+                best, current, shown = merge_leaderboard_stats(
+                    old["best"], old["game_id"], old["current"],
+                    game_id, (rounds_cleared, correct, answered)
+                )
+                old_pos = bisect.bisect_left(rows, (old["sort_key"], student_key))
+                del rows[old_pos]
+
+            new_key = leaderboard_sort_key(*shown)
+            # 每次都換一個新的 dict，已發佈的快照不會被改到
+            entry = {
+                "display_name": display_name,
+                "game_id": game_id,
+                "best": best,
+                "current": current,
+                "rounds_cleared": shown[0],
+                "correct": shown[1],
+                "answered": shown[2],
+                "sort_key": new_key,
+            }
+            self._entries[(user_class, student_key)] = entry
+            new_pos = bisect.bisect_left(rows, (new_key, student_key))
+            rows.insert(new_pos, (new_key, student_key))
+
+            # 只有異動碰到前段名次時才重新發佈快照
+            touched = new_pos if old_pos is None else min(old_pos, new_pos)
+            if touched < self._keep:
+                self._published[user_class] = tuple(
+                    self._entries[(user_class, sk)] for _, sk in rows[:self._keep]
+                )
+
+    def top_k(self, user_class, k=LEADERBOARD_TOP_K):
+        return list(self._published.get(user_class, ())[:k])
+
+
+class SQLiteLeaderboard:
+    """
+    SQLite 版排行榜，給多個 worker process 共用同一份排名。
+      - 主鍵查舊紀錄、寫回、前 k 名查詢都走 B-tree 索引，O(log n)
+      - WAL 模式：讀取前 k 名不會擋住寫入
+    """
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._local = threading.local()
+        self._conn().executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS leaderboard (
+                user_class     TEXT NOT NULL,
+                student_key    TEXT NOT NULL,
+                display_name   TEXT NOT NULL,
+                game_id        TEXT NOT NULL,
+                best_rounds    INTEGER,
+                best_correct   INTEGER,
+                best_answered  INTEGER,
+                cur_rounds     INTEGER NOT NULL,
+                cur_correct    INTEGER NOT NULL,
+                cur_answered   INTEGER NOT NULL,
+                rounds_cleared INTEGER NOT NULL,
+                correct        INTEGER NOT NULL,
+                answered       INTEGER NOT NULL,
+                accuracy       REAL NOT NULL,
+                PRIMARY KEY (user_class, student_key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_leaderboard_rank
+                ON leaderboard (user_class, rounds_cleared DESC, accuracy DESC, correct DESC);
+        """)
+
+    def _conn(self):
+        # sqlite3 連線不能跨 thread，每個 thread 各開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def submit(self, user_class, student_key, display_name, game_id,
+               rounds_cleared, correct, answered):
+        conn = self._conn()
+        # IMMEDIATE：讀舊紀錄到寫回之間，其他 worker 不能插進來改同一筆
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """
+                SELECT game_id, best_rounds, best_correct, best_answered,
+                       cur_rounds, cur_correct, cur_answered
+                FROM leaderboard
+                WHERE user_class = ? AND student_key = ?
+                """,
+                (user_class, student_key)
+            ).fetchone()
+            if row is None:
+                old_game_id, old_best, old_current = None, None, None
+            else:
+                old_game_id = row[0]
+                old_best = tuple(row[1:4]) if row[1] is not None else None
+                old_current = tuple(row[4:7])
+
+            best, current, shown = merge_leaderboard_stats(
+                old_best, old_game_id, old_current,
+                game_id, (rounds_cleared, correct, answered)
+            )
+            acc = (shown[1] / shown[2]) if shown[2] else 0.0
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO leaderboard
+                    (user_class, student_key, display_name, game_id,
+                     best_rounds, best_correct, best_answered,
+                     cur_rounds, cur_correct, cur_answered,
+                     rounds_cleared, correct, answered, accuracy)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (user_class, student_key, display_name, game_id)
+                + (best or (None, None, None))
+                + current + shown + (acc,)
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def top_k(self, user_class, k=LEADERBOARD_TOP_K):
+        cur = self._conn().execute(
+            """
+            SELECT display_name, game_id, rounds_cleared, correct, answered
+            FROM leaderboard
+            WHERE user_class = ?
+            ORDER BY rounds_cleared DESC, accuracy DESC, correct DESC, student_key
+            LIMIT ?
+            """,
+            (user_class, k)
+        )
+        return [
+            {
+                "display_name": nm,
+                "game_id": gid,
+                "rounds_cleared": rc,
+                "correct": c,
+                "answered": a,
+                "sort_key": leaderboard_sort_key(rc, c, a),
+            }
+            for nm, gid, rc, c, a in cur.fetchall()
+        ]
+
+
+@st.cache_resource
+def get_leaderboard():
+    """整個 server process 共用一份排行榜"""
+    db_path = os.environ.get(LEADERBOARD_DB_ENV, "").strip()
+    if db_path:
+        return SQLiteLeaderboard(db_path)
+    return MemoryLeaderboard()
+
+
+def current_student_key():
+    """
+    排行榜辨識學生：有設續玩密碼就用 identity_key（班級+座號+密碼的雜湊），
+    沒有就用 session_id。只打別人的班級座號拿不到別人的 key，也就接不走別人的成績。
+    改名只會更新顯示名稱。
+    """
+    identity = st.session_state.get("identity_key", "")
+    if identity:
+        return identity
+    return st.session_state.session_id
+
+
+def current_display_name():
+    seat = str(st.session_state.get("user_seat", "")).strip()
+    name = str(st.session_state.get("user_name", "")).strip()
+    if name and seat:
+        return f"{seat}號 {name}"
+    if name:
+        return name
+    if seat:
+        return f"{seat}號"
+    return "匿名"
+
+
+def report_to_leaderboard():
+    """把這一局目前的成績送進排行榜（沒填班級就不列入）"""
+    user_class = str(st.session_state.get("user_class", "")).strip()
+    if not user_class:
+        return
+
+    records = st.session_state.records
+    try:
+        get_leaderboard().submit(
+            user_class,
+            current_student_key(),
+            current_display_name(),
+            st.session_state.game_id,
+            st.session_state.rounds_cleared,
+            sum(1 for rec in records if rec[4]),
+            len(records),
+        )
+    except sqlite3.Error:
+        # 排行榜寫不進去（例如 database is locked）不能影響作答
+        logging.getLogger(__name__).exception("排行榜更新失敗")
+
+
+# ===================== 進度快照（斷線 / 重新部署後續玩） =====================
+SNAPSHOT_DB_ENV = "ELEMENT_APP_SNAPSHOT_DB"
+SNAPSHOT_DB_DEFAULT = "element_app_snapshots.db"
+SNAPSHOT_FLUSH_SEC = 0.5           # 寫入合併的時間窗：這段時間內同一個 key 只寫最後一次
+SNAPSHOT_TTL_SEC = 7 * 24 * 3600   # 超過這麼久沒更新的快照會被清掉
+SNAPSHOT_PRUNE_EVERY_SEC = 3600    # 最多多久清一次
+
+SNAPSHOT_MAGIC = b"EQS2"
+NO_ITEM = 0xFFFFFFFF               # 選項對不回題庫（例如 "???"）
+# magic, 題庫指紋, 模式, 回合(0=已結束), 題號, 本回合分數, 過關回合, 已交卷, game_id, 本回合題數
+_SNAP_HEAD = struct.Struct("<4sQBBHHBB16sH")
+# 回合, 題庫 index, 子模式, 對錯, 選了第幾個選項, 選項數
+_SNAP_REC = struct.Struct("<BIBBBB")
+
+@st.cache_resource
+def get_bank_index(xlsx_path="element_app.xlsx"):
+    """
+    快照用的題庫索引，跟 load_question_bank() 一樣以題庫檔為 key，整個 process 只算一次
+    （Streamlit 每次點擊都會重跑整個 script，不能每次都掃一遍題庫）：
+      fingerprint    -> 題庫指紋：題庫內容或順序變了，舊快照的 index 就不能用
+      option_to_qidx -> 選項字串 -> 題庫 index（快照裡的紀錄只存 index，不存字串）
+    """
+    bank = load_question_bank(xlsx_path)["bank"]
+    fingerprint = int.from_bytes(
+        hashlib.blake2b(
+            b"".join(it["id"].to_bytes(8, "big") for it in bank),
+            digest_size=8
+        ).digest(),
+        "big"
+    )
+    option_to_qidx = {"english": {}, "symbol": {}}
+    for i, it in enumerate(bank):
+        option_to_qidx["english"].setdefault(it["english"].strip(), i)
+        option_to_qidx["symbol"].setdefault(it["symbol"].strip(), i)
+    return {"fingerprint": fingerprint, "option_to_qidx": option_to_qidx}
+
+
+def _pack_str(text):
+    raw = text.encode("utf-8")
+    return struct.pack("<H", len(raw)) + raw
+
+
+def _unpack_str(buf, pos):
+    (n,) = struct.unpack_from("<H", buf, pos)
+    pos += 2
+    return buf[pos:pos + n].decode("utf-8"), pos + n
+
+
+def encode_snapshot():
+    """把目前這局的狀態壓成 bytes（題目、紀錄都只存題庫 index）"""
+    ss = st.session_state
+    bank_index = get_bank_index()
+    option_to_qidx = bank_index["option_to_qidx"]
+    submode_code_idx = {code: i for i, code in enumerate(SUBMODE_LIST_FOR_MIX)}
+
+    parts = [_SNAP_HEAD.pack(
+        SNAPSHOT_MAGIC,
+        bank_index["fingerprint"],
+        ALL_MODES.index(ss.chosen_mode_label),
+        ss.round or 0,
+        ss.cur_idx_in_round,
+        ss.score_this_round,
+        ss.rounds_cleared,
+        1 if ss.submitted else 0,
+        uuid.UUID(ss.game_id).bytes,
+        len(ss.cur_round_qidx),
+    )]
+    parts.append(struct.pack(f"<{len(ss.cur_round_qidx)}I", *ss.cur_round_qidx))
+    parts.append(bytes(submode_code_idx[c] for c in ss.submode_per_question))
+
+    # used_pairs -> 題庫 bitset
+    bits = bytearray((len(QUESTION_BANK) + 7) // 8)
+    eng_to_qidx = option_to_qidx["english"]
+    for en in ss.used_pairs:
+        i = eng_to_qidx.get(en)
+        if i is not None:
+            bits[i >> 3] |= 1 << (i & 7)
+    parts.append(struct.pack("<I", len(bits)))
+    parts.append(bytes(bits))
+
+    parts.append(struct.pack("<I", len(ss.records)))
+    for rnd, _, chosen, _, is_correct, opts, submode_code, qidx in ss.records:
+        opts = opts or []
+        lookup = option_to_qidx[answer_field(submode_code)]
+        chosen_pos = opts.index(chosen) if chosen in opts else 255
+        parts.append(_SNAP_REC.pack(
+            rnd, qidx, submode_code_idx[submode_code],
+            1 if is_correct else 0, chosen_pos, len(opts)
+        ))
+        parts.append(struct.pack(
+            f"<{len(opts)}I", *(lookup.get(o, NO_ITEM) for o in opts)
+        ))
+
+    # 目前這題的選項也要存：續玩後看到的選項要一樣，也不能靠重新整理換一個干擾選項
+    # （還沒出過選項的題目，在這裡先抽好放進 options_cache）
+    cur_opts = []
+    if ss.round and ss.cur_idx_in_round < len(ss.cur_round_qidx):
+        cur_qidx = ss.cur_round_qidx[ss.cur_idx_in_round]
+        cur_submode = ss.submode_per_question[ss.cur_idx_in_round]
+        cur_opts = get_options_for_q(cur_qidx, cur_submode)["display"]
+        lookup = option_to_qidx[answer_field(cur_submode)]
+        cur_opts = [lookup.get(o, NO_ITEM) for o in cur_opts]
+    parts.append(struct.pack(f"<B{len(cur_opts)}I", len(cur_opts), *cur_opts))
+
+    # 跨局的問法統計：每種問法 (作答數, 答對數)
+    for sm in SUBMODE_LIST_FOR_MIX:
+        parts.append(struct.pack("<II", *ss.submode_stats.get(sm, (0, 0))))
+
+    for key in ("user_name", "user_class", "user_seat", "identity_key"):
+        parts.append(_pack_str(str(ss.get(key, ""))))
+    return b"".join(parts)
+
+
+def decode_snapshot(blob):
+    """
+    encode_snapshot() 的反向。
+    回傳要寫回 session_state 的 dict；格式不對或題庫已變動 -> None
+    """
+    try:
+        (magic, fingerprint, mode_idx, rnd, cur_idx, score, rounds_cleared,
+         submitted, game_id, n_q) = _SNAP_HEAD.unpack_from(blob, 0)
+        if magic != SNAPSHOT_MAGIC or fingerprint != get_bank_index()["fingerprint"]:
+            return None
+        pos = _SNAP_HEAD.size
+
+        qidx_list = list(struct.unpack_from(f"<{n_q}I", blob, pos))
+        pos += 4 * n_q
+        submodes = [SUBMODE_LIST_FOR_MIX[b] for b in blob[pos:pos + n_q]]
+        pos += n_q
+
+        (n_bits,) = struct.unpack_from("<I", blob, pos)
+        pos += 4
+        used_pairs = set()
+        for byte_i, byte in enumerate(blob[pos:pos + n_bits]):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    used_pairs.add(QUESTION_BANK[(byte_i << 3) | bit]["english"])
+        pos += n_bits
+
+        (n_rec,) = struct.unpack_from("<I", blob, pos)
+        pos += 4
+        records = []
+        for _ in range(n_rec):
+            r_round, qidx, sub_i, is_correct, chosen_pos, n_opts = _SNAP_REC.unpack_from(blob, pos)
+            pos += _SNAP_REC.size
+            opt_qidx = struct.unpack_from(f"<{n_opts}I", blob, pos)
+            pos += 4 * n_opts
+
+            submode_code = SUBMODE_LIST_FOR_MIX[sub_i]
+            field = answer_field(submode_code)
+            q = QUESTION_BANK[qidx]
+            opts = [
+                QUESTION_BANK[i][field].strip() if i != NO_ITEM else "???"
+                for i in opt_qidx
+            ]
+            correct = q[field].strip()
+            chosen = opts[chosen_pos] if chosen_pos < len(opts) else ""
+            records.append((
+                r_round, prompt_for_record(q, submode_code), chosen, correct,
+                bool(is_correct), opts or None, submode_code, qidx
+            ))
+
+        (n_cur,) = struct.unpack_from("<B", blob, pos)
+        pos += 1
+        cur_opt_qidx = struct.unpack_from(f"<{n_cur}I", blob, pos)
+        pos += 4 * n_cur
+        options_cache = {}
+        if n_cur:
+            cur_qidx = qidx_list[cur_idx]
+            cur_submode = submodes[cur_idx]
+            field = answer_field(cur_submode)
+            options_cache[(cur_qidx, cur_submode)] = {"display": [
+                QUESTION_BANK[i][field].strip() if i != NO_ITEM else "???"
+                for i in cur_opt_qidx
+            ]}
+
+        submode_stats = {}
+        for sm in SUBMODE_LIST_FOR_MIX:
+            submode_stats[sm] = list(struct.unpack_from("<II", blob, pos))
+            pos += 8
+
+        user_fields = {}
+        for key in ("user_name", "user_class", "user_seat", "identity_key"):
+            user_fields[key], pos = _unpack_str(blob, pos)
+    except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+        return None
+
+    state = {
+        "chosen_mode_label": ALL_MODES[mode_idx],
+        "round": rnd or None,
+        "cur_idx_in_round": cur_idx,
+        "score_this_round": score,
+        "rounds_cleared": rounds_cleared,
+        "submitted": bool(submitted),
+        "game_id": str(uuid.UUID(bytes=game_id)),
+        "cur_round_qidx": qidx_list,
+        "submode_per_question": submodes,
+        "used_pairs": used_pairs,
+        "records": records,
+        "options_cache": options_cache,
+        "submode_stats": submode_stats,
+    }
+    state.update(user_fields)
+    return state
+
+
+class SnapshotStore:
+    """
+    本機 SQLite 快照庫，key -> 最新一份快照 blob。
+      put()/delete() 只是把資料放進待寫 dict（不碰磁碟），按鈕反應不會被拖慢；
+      背景 thread 每 SNAPSHOT_FLUSH_SEC 秒把累積的變更一次寫進同一個 transaction。
+      get() 先看待寫 dict，再查一次主鍵。
+    做完的局、關掉的分頁不會再來刪自己的快照，所以啟動時和 flush() 時
+    （最多每 SNAPSHOT_PRUNE_EVERY_SEC 秒一次）清掉超過 SNAPSHOT_TTL_SEC 沒更新的快照。
+    """
+
+    def __init__(self, db_path, flush_interval=SNAPSHOT_FLUSH_SEC, ttl=SNAPSHOT_TTL_SEC):
+        self._db_path = db_path
+        self._flush_interval = flush_interval
+        self._ttl = ttl
+        self._last_prune = 0.0
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._pending = {}           # key -> blob（None = 刪除）
+        conn = self._conn()
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS snapshots (
+                key        TEXT PRIMARY KEY,
+                blob       BLOB NOT NULL,
+                updated_at REAL NOT NULL DEFAULT 0
+            );
+        """)
+        # 舊的快照檔沒有 updated_at 欄位 -> 補上（既有的列視為很久以前，下次清理就會清掉）
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(snapshots)")}
+        if "updated_at" not in columns:
+            conn.execute("ALTER TABLE snapshots ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_snapshots_updated ON snapshots (updated_at)"
+        )
+        try:
+            self.prune()
+        except sqlite3.Error:
+            logging.getLogger(__name__).exception("清理過期快照失敗")
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def _conn(self):
+        # sqlite3 連線不能跨 thread，每個 thread 各開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def put(self, keys, blob):
+        with self._cond:
+            for key in keys:
+                self._pending[key] = blob
+            self._cond.notify()
+
+    def delete(self, keys):
+        self.put(keys, None)
+
+    def get(self, key):
+        with self._cond:
+            if key in self._pending:
+                return self._pending[key]
+        row = self._conn().execute(
+            "SELECT blob FROM snapshots WHERE key = ?", (key,)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def prune(self):
+        """刪掉超過 ttl 沒更新的快照"""
+        now = time.time()
+        self._last_prune = now
+        self._conn().execute(
+            "DELETE FROM snapshots WHERE updated_at < ?", (now - self._ttl,)
+        )
+
+    def flush(self):
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        conn = self._conn()
+        now = time.time()
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO snapshots (key, blob, updated_at) VALUES (?, ?, ?)",
+                [(k, b, now) for k, b in batch.items() if b is not None]
+            )
+            conn.executemany(
+                "DELETE FROM snapshots WHERE key = ?",
+                [(k,) for k, b in batch.items() if b is None]
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            # 不能讓連線卡在沒結束的 transaction 裡，不然之後每次 BEGIN 都會失敗
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # 放回待寫 dict 下次再試；這段期間有更新的快照就用新的
+            with self._cond:
+                for k, b in batch.items():
+                    self._pending.setdefault(k, b)
+            raise
+
+        if now - self._last_prune >= SNAPSHOT_PRUNE_EVERY_SEC:
+            self.prune()
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # 等一個時間窗，讓連續點擊合併成一次寫入
+            time.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                logging.getLogger(__name__).exception(
+                    "快照寫入失敗，%s 秒後重試", self._flush_interval
+                )
+
+
+@st.cache_resource
+def get_snapshot_store():
+    """整個 server process 共用一個快照庫"""
+    db_path = os.environ.get(SNAPSHOT_DB_ENV, "").strip() or SNAPSHOT_DB_DEFAULT
+    return SnapshotStore(db_path)
+
+
+RESUME_PIN_MIN_LEN = 4
+
+
+def snapshot_keys():
+    """快照存在 resume token 底下；開始作答時有設續玩密碼的話，也存一份在學生身分底下"""
+    keys = [f"tok:{st.session_state.session_id}"]
+    identity = st.session_state.get("identity_key", "")
+    if identity:
+        keys.append(identity)
+    return keys
+
+
+def identity_snapshot_key():
+    """
+    學生身分 key = 班級 + 座號 + 續玩密碼 的雜湊。
+    只知道別人的班級座號查不到（也看不出有沒有）他的進度，一定要有本人設的密碼。
+    """
+    user_class = str(st.session_state.get("user_class", "")).strip()
+    user_seat = str(st.session_state.get("user_seat", "")).strip()
+    pin = str(st.session_state.get("resume_pin", "")).strip()
+    if user_class and user_seat and len(pin) >= RESUME_PIN_MIN_LEN:
+        digest = hashlib.blake2b(
+            f"{user_class}|{user_seat}|{pin}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return f"id:{digest}"
+    return None
+
+
+def save_snapshot():
+    """每次 handle_action 後呼叫；網址帶上 resume token，重新整理也找得回來"""
+    if not st.session_state.mode_locked:
+        return
+    st.query_params["resume"] = st.session_state.session_id
+    get_snapshot_store().put(snapshot_keys(), encode_snapshot())
+
+
+def discard_snapshot():
+    get_snapshot_store().delete(snapshot_keys())
+
+
+def restore_snapshot(key):
+    """用一個 key 查快照並寫回 session_state；成功回傳 True"""
+    blob = get_snapshot_store().get(key)
+    state = decode_snapshot(blob) if blob else None
+    if state is None:
+        return False
+
+    init_game_state()
+    for k, v in state.items():
+        st.session_state[k] = v
+    st.session_state.mode_locked = True
+    if key.startswith("tok:"):
+        st.session_state.session_id = key[len("tok:"):]
+    st.query_params["resume"] = st.session_state.session_id
+    return True
 
 
 # ===================== Session State 初始化 & 工具 =====================
 def init_game_state():
     """初始化遊戲用的狀態 (不包含 user_name 等資料)"""
+    # 上一局的作答先併進跨局的問法統計（混合模式用來判斷弱項）
+    stats = {sm: list(v) for sm, v in st.session_state.get("submode_stats", {}).items()}
+    for rec in st.session_state.get("records", []):
+        sm_stats = stats.setdefault(rec[6], [0, 0])
+        sm_stats[0] += 1
+        sm_stats[1] += 1 if rec[4] else 0
+    st.session_state.submode_stats = stats           # submode -> [作答數, 答對數]（之前幾局累計）
+
     st.session_state.round = 1
     st.session_state.used_pairs = set()             # 用過的 key，減少重複
     st.session_state.cur_round_qidx = []            # 本回合抽到的題庫 index
@@ -256,7 +879,9 @@ def init_game_state():
     st.session_state.answer_cache = ""              # 保留輸入（如果之後要文字輸入）
     st.session_state.options_cache = {}             # (qidx, submode) -> options
     st.session_state.submode_per_question = []      # 和 cur_round_qidx 對齊，記錄每題用哪種問法
-    st.session_state.records = []                   # (round,prompt,chosen,correct_show,is_correct,opts,submode)
+    st.session_state.records = []                   # (round,prompt,chosen,correct_show,is_correct,opts,submode,qidx)
+    st.session_state.rounds_cleared = 0             # 全對過關的回合數（排行榜用）
+    st.session_state.game_id = str(uuid.uuid4())    # 每一局一個 id，排行榜用來分辨是不是同一局
 
     if "session_id" not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
@@ -273,13 +898,23 @@ def start_new_round():
         st.session_state.used_pairs = set()
         available = list(range(len(QUESTION_BANK)))
 
-    if len(available) <= QUESTIONS_PER_ROUND:
-        chosen = available[:]
-        random.shuffle(chosen)
+    # 針對每一題決定子模式
+    if st.session_state.chosen_mode_label == MODE_4:
+        # 混合：題目和問法一起排（問法平均、弱項優先、同題同問法不重複）
+        history = [(rec[7], rec[6], rec[4]) for rec in st.session_state.records]
+        # 這一局只會在全對後才進下一回合，只看這一局看不出弱項 -> 加上之前幾局的統計
+        chosen, submodes = compose_mixed_round(
+            available, QUESTIONS_PER_ROUND, history,
+            past_stats=st.session_state.submode_stats
+        )
     else:
-        chosen = random.sample(available, QUESTIONS_PER_ROUND)
+        # 非混合 -> 全部同一種子模式
+        chosen = pick_round_items(available, QUESTIONS_PER_ROUND)
+        code = SUBMODE_NAME_TO_CODE[st.session_state.chosen_mode_label]
+        submodes = [code for _ in chosen]
 
     st.session_state.cur_round_qidx = chosen
+    st.session_state.submode_per_question = submodes
     st.session_state.cur_idx_in_round = 0
     st.session_state.score_this_round = 0
     st.session_state.submitted = False
@@ -287,16 +922,6 @@ def start_new_round():
     st.session_state.answer_cache = ""
     st.session_state.options_cache = {}
 
-    # 針對每一題決定子模式
-    if st.session_state.chosen_mode_label == MODE_4:
-        st.session_state.submode_per_question = [
-            random.choice(SUBMODE_LIST_FOR_MIX) for _ in chosen
-        ]
-    else:
-        # 非混合 -> 全部同一種子模式
-        code = SUBMODE_NAME_TO_CODE[st.session_state.chosen_mode_label]
-        st.session_state.submode_per_question = [code for _ in chosen]
-
 
 def ensure_state_ready():
     needed_keys = [
@@ -316,10 +941,19 @@ def ensure_state_ready():
         "user_class",
         "user_seat",
         "submode_per_question",
-        "records"
+        "records",
+        "rounds_cleared",
+        "game_id",
+        "submode_stats"
     ]
     missing = any(k not in st.session_state for k in needed_keys)
 
+    # 新的 session（斷線重連 / server 重啟）-> 先用網址上的 resume token 找快照
+    if missing and "mode_locked" not in st.session_state:
+        token = st.query_params.get("resume")
+        if token and restore_snapshot(f"tok:{token}"):
+            missing = False
+
     if missing:
         if "mode_locked" not in st.session_state:
             st.session_state.mode_locked = False
@@ -332,6 +966,10 @@ def ensure_state_ready():
             st.session_state.user_class = ""
         if "user_seat" not in st.session_state:
             st.session_state.user_seat = ""
+        if "resume_pin" not in st.session_state:
+            st.session_state.resume_pin = ""
+        if "identity_key" not in st.session_state:
+            st.session_state.identity_key = ""
 
         init_game_state()
 
@@ -360,42 +998,8 @@ def get_options_for_q(qidx, submode_code):
     if key in st.session_state.options_cache:
         return st.session_state.options_cache[key]
 
-    item = QUESTION_BANK[qidx]
-    correct_name   = item["name"].strip()
-    correct_eng    = item["english"].strip()
-    correct_symbol = item["symbol"].strip()
-
-    if submode_code == "name_to_eng":
-        # 正解 = English，干擾 = 另一個 English
-        pool = [
-            it["english"].strip()
-            for it in QUESTION_BANK
-            if it["english"].strip().lower() != correct_eng.lower()
-        ]
-        distractor = random.choice(pool) if pool else "???"
-        opts = [correct_eng, distractor]
-
-    elif submode_code == "eng_to_sym":
-        # 正解 = Symbol，干擾 = 另一個 Symbol
-        pool = [
-            it["symbol"].strip()
-            for it in QUESTION_BANK
-            if it["symbol"].strip().lower() != correct_symbol.lower()
-        ]
-        distractor = random.choice(pool) if pool else "???"
-        opts = [correct_symbol, distractor]
-
-    else:  # "sym_to_eng"
-        # 正解 = English，干擾 = 另一個 English
-        pool = [
-            it["english"].strip()
-            for it in QUESTION_BANK
-            if it["english"].strip().lower() != correct_eng.lower()
-        ]
-        distractor = random.choice(pool) if pool else "???"
-        opts = [correct_eng, distractor]
-
-    random.shuffle(opts)
+    # 正解 + 一個干擾選項（干擾抽法見 question_bank.pick_distractor）
+    _, opts = build_options(QUESTION_BANK, qidx, submode_code)
     payload = {"display": opts[:]}
 
     st.session_state.options_cache[key] = payload
@@ -441,19 +1045,7 @@ def render_question():
 
     submode_code = st.session_state.submode_per_question[cur_pos]
 
-    # 根據 submode_code 決定題目文字與正確答案欄位
-    if submode_code == "name_to_eng":
-        # 題幹：給 Name
-        prompt_txt = q["name"].strip()
-        question_prompt = f'「{prompt_txt}」的正確英文是？'
-    elif submode_code == "eng_to_sym":
-        # 題幹：給 English
-        prompt_txt = q["english"].strip()
-        question_prompt = f'「{prompt_txt}」對應的正確符號(Symbol)是？'
-    else:  # "sym_to_eng"
-        # 題幹：給 Symbol
-        prompt_txt = q["symbol"].strip()
-        question_prompt = f'符號「{prompt_txt}」的正確英文名稱是？'
+    question_prompt = question_prompt_text(q, submode_code)
 
     st.markdown(
         f"<h2>Q{cur_pos + 1}. {question_prompt}</h2>",
@@ -514,7 +1106,8 @@ def handle_action(qidx, q, submode_code, user_input):
             correct_answer,             # 正確答案
             is_correct,                 # 對錯
             (payload["display"] if (payload and "display" in payload) else None),
-            submode_code                # 紀錄出題型態
+            submode_code,               # 紀錄出題型態
+            qidx                        # 題庫 index（快照用）
         ))
 
         # 產生回饋
@@ -544,6 +1137,8 @@ def handle_action(qidx, q, submode_code, user_input):
                     f"{correct_eng} （Symbol: {correct_symbol}, Name: {correct_name}）</div>"
                 )
 
+        report_to_leaderboard()
+        save_snapshot()
         st.rerun()
         return
 
@@ -566,6 +1161,9 @@ def handle_action(qidx, q, submode_code, user_input):
             )
             has_more_rounds = (st.session_state.round < MAX_ROUNDS)
 
+            if full_score:
+                st.session_state.rounds_cleared += 1
+
             if full_score and has_more_rounds:
                 st.session_state.round += 1
                 start_new_round()
@@ -573,6 +1171,8 @@ def handle_action(qidx, q, submode_code, user_input):
                 # 遊戲結束
                 st.session_state.round = None
 
+        report_to_leaderboard()
+        save_snapshot()
         st.rerun()
         return
 
@@ -589,6 +1189,44 @@ def prompt_for_record(q, submode_code):
         return q["symbol"].strip()
 
 
+# ===================== 排行榜顯示 =====================
+def render_leaderboard(k, compact=False):
+    """顯示自己班級的前 k 名；compact=True 給側邊欄用（純文字列表）"""
+    user_class = str(st.session_state.get("user_class", "")).strip()
+    if not user_class:
+        st.caption("填寫班級後即可查看班級排行榜。")
+        return
+
+    rows = get_leaderboard().top_k(user_class, k)
+    if not rows:
+        st.caption(f"{user_class} 班目前還沒有成績。")
+        return
+
+    if compact:
+        lines = []
+        for rank, row in enumerate(rows, start=1):
+            acc = (row["correct"] / row["answered"] * 100) if row["answered"] else 0.0
+            lines.append(
+                f"{rank}. {row['display_name']}｜過關 {row['rounds_cleared']}｜{acc:.0f}%"
+            )
+        st.markdown("  \n".join(lines))
+    else:
+        table = pd.DataFrame([
+            {
+                "名次": rank,
+                "學生": row["display_name"],
+                "過關回合": row["rounds_cleared"],
+                "答對 / 作答": f"{row['correct']} / {row['answered']}",
+                "正確率": (
+                    f"{row['correct'] / row['answered'] * 100:.1f}%"
+                    if row["answered"] else "0.0%"
+                ),
+            }
+            for rank, row in enumerate(rows, start=1)
+        ])
+        st.table(table.set_index("名次"))
+
+
 # ===================== 畫面一：模式選擇頁 =====================
 def render_mode_select_page():
     st.markdown("## 選擇練習模式")
@@ -607,18 +1245,34 @@ def render_mode_select_page():
     st.session_state.user_seat = st.text_input(
         "座號", st.session_state.get("user_seat", "")
     )
+    st.session_state.resume_pin = st.text_input(
+        f"續玩密碼（選填，至少 {RESUME_PIN_MIN_LEN} 碼；換裝置時用來接續進度）",
+        st.session_state.get("resume_pin", ""),
+        type="password"
+    )
 
     if st.button("開始作答 ▶"):
         st.session_state.chosen_mode_label = chosen
         st.session_state.mode_locked = True
+        st.session_state.identity_key = identity_snapshot_key() or ""
 
         init_game_state()
         # chosen_mode_label 會在 start_new_round() 被參考
         st.session_state.chosen_mode_label = chosen
         start_new_round()
+        save_snapshot()
 
         st.rerun()
 
+    # 換了裝置 / 網址沒帶 resume token：用班級 + 座號 + 續玩密碼找上次的進度
+    identity = identity_snapshot_key()
+    if identity and get_snapshot_store().get(identity):
+        if st.button("⏯ 繼續上次進度"):
+            if restore_snapshot(identity):
+                st.rerun()
+            else:
+                st.warning("上次的進度已無法使用（題庫可能已更新）。")
+
 
 # ===================== 畫面二：作答頁 =====================
 def render_quiz_page():
@@ -646,11 +1300,16 @@ def render_quiz_page():
         st.write(st.session_state.chosen_mode_label)
 
         if st.button("🔄 重新開始（重新選模式）"):
+            discard_snapshot()
             st.session_state.mode_locked = False
             st.session_state.chosen_mode_label = None
             init_game_state()
             st.rerun()
 
+        st.markdown("---")
+        st.markdown(f"### 🏆 班級排行（前 {LEADERBOARD_SIDEBAR_K} 名）")
+        render_leaderboard(LEADERBOARD_SIDEBAR_K, compact=True)
+
     # 主內容
     if st.session_state.round:
         # 進行中
@@ -669,8 +1328,8 @@ def render_quiz_page():
         # 題目提交後複習區
         if st.session_state.submitted and st.session_state.records:
             last = st.session_state.records[-1]
-            # last = (round,prompt,chosen_label,correct_answer,is_correct,opts,submode_code)
-            _, _, _, correct_ans, _, opts_disp, last_submode = last
+            # last = (round,prompt,chosen_label,correct_answer,is_correct,opts,submode_code,qidx)
+            _, _, _, correct_ans, _, opts_disp, last_submode, _ = last
 
             st.markdown("---")
             if last_submode == "name_to_eng":
@@ -732,21 +1391,61 @@ def render_quiz_page():
             f"<h3>Accuracy: {acc:.1f}%</h3>",
             unsafe_allow_html=True
         )
+        st.markdown(
+            f"<h3>Rounds Cleared: {st.session_state.rounds_cleared} / {MAX_ROUNDS}</h3>",
+            unsafe_allow_html=True
+        )
+
+        st.subheader(f"🏆 班級排行榜（前 {LEADERBOARD_TOP_K} 名）")
+        render_leaderboard(LEADERBOARD_TOP_K)
 
         if st.button("🔄 再玩一次（同模式）"):
             init_game_state()
             start_new_round()
+            save_snapshot()
             st.rerun()
 
         if st.button("🧪 選別的模式"):
+            discard_snapshot()
             st.session_state.mode_locked = False
             st.session_state.chosen_mode_label = None
             init_game_state()
             st.rerun()
 
 
+# ===================== 管理頁：題庫檢查報告 =====================
+def render_admin_page():
+    st.markdown("## 題庫檢查報告")
+
+    if not loaded["ok"]:
+        st.error(loaded["error"])
+        return
+
+    report = loaded["report"]
+    counts = report["counts"]
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Excel 資料列", report["total_rows"])
+    c2.metric("有效題目", report["kept"])
+    c3.metric("問題筆數", sum(counts.values()))
+    st.caption(f"欄位：{loaded['debug_cols']}")
+
+    if not any(counts.values()):
+        st.success("沒有發現重複或撞名的題目。")
+        return
+
+    for kind, label in BANK_ISSUE_LABELS.items():
+        if not counts[kind]:
+            continue
+        st.markdown(f"**{label}**：{counts[kind]} 筆")
+        st.dataframe(pd.DataFrame(report["issues"][kind]), use_container_width=True)
+        if counts[kind] > len(report["issues"][kind]):
+            st.caption(f"僅列出前 {len(report['issues'][kind])} 筆。")
+
+
 # ===================== 頁面路由 =====================
-if not st.session_state.mode_locked:
+if IS_ADMIN_PAGE:
+    render_admin_page()
+elif not st.session_state.mode_locked:
     render_mode_select_page()
 else:
     render_quiz_page()
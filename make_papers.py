@@ -0,0 +1,225 @@
+"""
+離線出卷：用和網頁相同的題庫邏輯（抽題、干擾選項、三種問法），
+一次產生大量紙本考卷與答案卷。
+
+  python make_papers.py --papers 500 --seed 2024 --out papers.xlsx
+  python make_papers.py --papers 5000 --mode mix --out papers.csv
+
+- 每份考卷的亂數種子 = "<seed>:<卷號>"，同樣的參數一定產生同樣的考卷，
+  和用了幾個 CPU 核心無關；單獨重出某一份也只要同一組 seed 與卷號。
+- 多個 process 平行出卷，主 process 依卷號順序邊收邊寫檔，
+  同時在途的批次有上限，不會把全部考卷留在記憶體裡。
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from question_bank import (
+    SUBMODES,
+    build_options,
+    compose_mixed_round,
+    pick_round_items,
+    question_prompt_text,
+    read_question_bank,
+)
+
+MODE_CHOICES = list(SUBMODES) + ["mix"]
+OPTION_LABELS = "AB"
+
+PAPER_HEADER = ["卷號", "種子", "題號", "問法", "題目", "(A)", "(B)"]
+ANSWER_HEADER = ["卷號", "題號", "答案", "正解"]
+
+_BANK = None          # 每個 worker 各自持有一份題庫
+
+
+def _init_worker(bank):
+    global _BANK
+    _BANK = bank
+
+
+def paper_seed(base_seed, paper_no):
+    return f"{base_seed}:{paper_no}"
+
+
+def make_paper(bank, paper_no, base_seed, n_questions, mode):
+    """
+    產生一份考卷。
+    回傳 (題目列, 答案列)，欄位對應 PAPER_HEADER / ANSWER_HEADER
+    """
+    seed = paper_seed(base_seed, paper_no)
+    rng = random.Random(seed)
+
+    if mode == "mix":
+        chosen, submodes = compose_mixed_round(range(len(bank)), n_questions, rng=rng)
+    else:
+        chosen = pick_round_items(range(len(bank)), n_questions, rng)
+        submodes = [mode for _ in chosen]
+
+    question_rows = []
+    answer_rows = []
+    for q_no, (qidx, submode_code) in enumerate(zip(chosen, submodes), start=1):
+        correct, opts = build_options(bank, qidx, submode_code, rng)
+        question_rows.append(
+            [paper_no, seed, q_no, submode_code,
+             question_prompt_text(bank[qidx], submode_code)] + opts
+        )
+        answer_rows.append(
+            [paper_no, q_no, OPTION_LABELS[opts.index(correct)], correct]
+        )
+    return question_rows, answer_rows
+
+
+def _make_batch(args):
+    start, end, base_seed, n_questions, mode = args
+    return [
+        make_paper(_BANK, paper_no, base_seed, n_questions, mode)
+        for paper_no in range(start, end)
+    ]
+
+
+# ===================== 輸出 =====================
+class CsvSink:
+    def __init__(self, paper_path, answer_path):
+        self._files = [
+            open(paper_path, "w", newline="", encoding="utf-8-sig"),
+            open(answer_path, "w", newline="", encoding="utf-8-sig"),
+        ]
+        self._papers, self._answers = (csv.writer(f) for f in self._files)
+        self._papers.writerow(PAPER_HEADER)
+        self._answers.writerow(ANSWER_HEADER)
+
+    def write(self, question_rows, answer_rows):
+        self._papers.writerows(question_rows)
+        self._answers.writerows(answer_rows)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+
+class XlsxSink:
+    """
+    openpyxl write-only 模式：逐列寫出，不在記憶體裡保留整張表。
+    沒給 answer_path -> 答案放在同一個檔的「答案」工作表；有給 -> 另存一個答案檔
+    """
+
+    def __init__(self, path, answer_path=""):
+        from openpyxl import Workbook
+
+        self._books = [(Workbook(write_only=True), path)]
+        if answer_path:
+            self._books.append((Workbook(write_only=True), answer_path))
+        self._papers = self._books[0][0].create_sheet("考卷")
+        self._answers = self._books[-1][0].create_sheet("答案")
+        self._papers.append(PAPER_HEADER)
+        self._answers.append(ANSWER_HEADER)
+
+    def write(self, question_rows, answer_rows):
+        for row in question_rows:
+            self._papers.append(row)
+        for row in answer_rows:
+            self._answers.append(row)
+
+    def close(self):
+        for wb, path in self._books:
+            wb.save(path)
+
+
+def is_xlsx(path):
+    return path.lower().endswith(".xlsx")
+
+
+def open_sink(out_path, answers_path):
+    if is_xlsx(out_path):
+        return XlsxSink(out_path, answers_path)
+    if not answers_path:
+        stem, ext = os.path.splitext(out_path)
+        answers_path = f"{stem}_answers{ext or '.csv'}"
+    return CsvSink(out_path, answers_path)
+
+
+# ===================== 主流程 =====================
+def iter_batches(args, bank):
+    """依卷號順序產出每一批考卷；workers > 1 時平行產生，在途批次數有上限"""
+    tasks = (
+        (start, min(start + args.batch, args.papers + 1), args.seed, args.questions, args.mode)
+        for start in range(1, args.papers + 1, args.batch)
+    )
+
+    if args.workers <= 1:
+        _init_worker(bank)
+        for task in tasks:
+            yield _make_batch(task)
+        return
+
+    with Pool(args.workers, initializer=_init_worker, initargs=(bank,)) as pool:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(pool.apply_async(_make_batch, (task,)))
+            if len(in_flight) >= args.workers * 4:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線批次產生考卷與答案卷")
+    parser.add_argument("--bank", default="element_app.xlsx", help="題庫 Excel 檔")
+    parser.add_argument("--papers", type=int, default=100, help="要產生幾份考卷")
+    parser.add_argument("--questions", type=int, default=10, help="每份考卷題數")
+    parser.add_argument("--mode", choices=MODE_CHOICES, default="mix", help="問法（mix = 三種混合）")
+    parser.add_argument("--seed", default="0", help="基礎亂數種子")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="平行 process 數")
+    parser.add_argument("--batch", type=int, default=50, help="每個工作批次的考卷數")
+    parser.add_argument("--out", default="papers.xlsx", help="輸出檔 (.xlsx 或 .csv)")
+    parser.add_argument(
+        "--answers", default="",
+        help="答案卷另存的檔名，格式要和 --out 一樣"
+             "（預設：.xlsx 放在同一檔的「答案」工作表；.csv 為 <out>_answers.csv）"
+    )
+    args = parser.parse_args(argv)
+
+    if args.papers < 1 or args.questions < 1 or args.batch < 1:
+        parser.error("--papers / --questions / --batch 必須是正整數")
+    if args.answers and is_xlsx(args.answers) != is_xlsx(args.out):
+        parser.error("--answers 的檔案格式必須和 --out 一樣（都是 .xlsx 或都是 .csv）")
+
+    loaded = read_question_bank(args.bank)
+    bank = loaded["bank"]
+    if not loaded["ok"] or not bank:
+        print(loaded["error"] or "⚠ 題庫為空，請檢查 Excel 欄位。", file=sys.stderr)
+        return 1
+
+    sink = open_sink(args.out, args.answers)
+    done = 0
+    t0 = last_report = time.perf_counter()
+    try:
+        for batch in iter_batches(args, bank):
+            for question_rows, answer_rows in batch:
+                sink.write(question_rows, answer_rows)
+            done += len(batch)
+
+            now = time.perf_counter()
+            if now - last_report >= 1.0:
+                last_report = now
+                print(f"已完成 {done} / {args.papers} 份（{done / (now - t0):.0f} 份/秒）",
+                      file=sys.stderr)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - t0
+    print(
+        f"完成：{done} 份考卷，{elapsed:.2f} 秒，"
+        f"{done / elapsed if elapsed else 0:.0f} 份/秒（workers={args.workers}）",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+題庫相關的純邏輯（不依賴 streamlit），網頁 element_app.py 與離線出卷 make_papers.py 共用：
+  - 讀 Excel、欄位自動對應、檢查 / 去重
+  - 三種問法的題幹文字、正解、干擾選項
+"""
+import random
+import hashlib
+import pandas as pd
+
+
+SUBMODES = ("name_to_eng", "eng_to_sym", "sym_to_eng")
+
+
+# ===================== 題庫檢查 / 去重 =====================
+BANK_FIELDS = ("name", "english", "symbol")
+REPORT_SAMPLE_LIMIT = 500      # 每一類問題最多列出幾筆明細（總數照算）
+
+BANK_ISSUE_LABELS = {
+    "missing_field":        "缺少 Name / English / Symbol（已略過）",
+    "duplicate_english":    "English 完全重複（已略過）",
+    "case_variant_english": "English 只差大小寫（已略過）",
+    "duplicate_symbol":     "Symbol 被多筆共用",
+    "duplicate_name":       "Name 重複",
+    "cross_field":          "跨欄位撞名（例如 Name 等於別筆的 Symbol）",
+}
+
+
+def stable_item_id(english):
+    """用 English（忽略大小寫）算出固定的整數 ID，題庫增刪、換順序都不會變"""
+    digest = hashlib.blake2b(english.lower().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def validate_question_bank(rows):
+    """
+    rows: 可迭代的 (excel列號, name, english, symbol)，字串已 strip。
+
+    一次掃描、用 dict 做雜湊比對，找出會讓出題/對答案出錯的撞名：
+      - English 重複或只差大小寫：English 是 used_pairs 的唯一 key -> 後出現的那筆略過
+      - Symbol / Name 重複、某筆的值等於別筆另一欄的值：會讓干擾選項或複習區對錯題 -> 保留但列入報告
+
+    回傳 (bank_list, report)
+    """
+    bank_list = []
+    issues = {k: [] for k in BANK_ISSUE_LABELS}
+    counts = {k: 0 for k in BANK_ISSUE_LABELS}
+    seen = {f: {} for f in BANK_FIELDS}   # 欄位 -> {小寫值: (excel列號, 原始字串)}，只記第一次出現
+    total_rows = 0
+
+    def add_issue(kind, **detail):
+        counts[kind] += 1
+        if len(issues[kind]) < REPORT_SAMPLE_LIMIT:
+            issues[kind].append(detail)
+
+    for row_no, nm, en, sy in rows:
+        total_rows += 1
+        if not (nm and en and sy):
+            add_issue("missing_field", row=row_no, name=nm, english=en, symbol=sy)
+            continue
+
+        en_key = en.lower()
+        first_en = seen["english"].get(en_key)
+        if first_en is not None:
+            kind = "duplicate_english" if first_en[1] == en else "case_variant_english"
+            add_issue(kind, row=row_no, value=en, other_row=first_en[0], other_value=first_en[1])
+            continue
+
+        # 先比對完整列，再登記，避免同一筆自己撞自己
+        values = (("name", nm, nm.lower()), ("english", en, en_key), ("symbol", sy, sy.lower()))
+        for field, val, key in values:
+            for other_field in BANK_FIELDS:
+                hit = seen[other_field].get(key)
+                if hit is None:
+                    continue
+                if other_field == field:
+                    add_issue(f"duplicate_{field}", row=row_no, value=val,
+                              other_row=hit[0], other_value=hit[1])
+                else:
+                    add_issue("cross_field", row=row_no, field=field, value=val,
+                              other_row=hit[0], other_field=other_field, other_value=hit[1])
+
+        for field, val, key in values:
+            seen[field].setdefault(key, (row_no, val))
+
+        bank_list.append({
+            "id": stable_item_id(en),
+            "row": row_no,
+            "name": nm,
+            "english": en,
+            "symbol": sy,
+        })
+
+    report = {
+        "total_rows": total_rows,
+        "kept": len(bank_list),
+        "counts": counts,
+        "issues": issues,
+    }
+    return bank_list, report
+
+
+# ===================== 題庫載入（容錯版，這次抓 name / english / symbol） =====================
+def read_question_bank(xlsx_path="element_app.xlsx"):
+    """
+    嘗試讀取 Excel 並自動對應三欄：
+      name    -> 可能: Name, 中文, 名稱, Chinese, CN
+      english -> 可能: English, 英文, Term, 英文名, EN, English term
+      symbol  -> 可能: Symbol, 符號, 元素符號, abbrev, 符號Symbol, 符號/代號, symbol(en)
+
+    回傳:
+    {
+      "ok": bool,
+      "error": str,
+      "bank": [ { "id":..., "row":..., "name":..., "english":..., "symbol":...}, ... ],
+      "debug_cols": [...],
+      "report": {...}     # validate_question_bank() 的檢查報告
+    }
+    """
+    try:
+        df = pd.read_excel(xlsx_path)
+    except Exception as e:
+        return {
+            "ok": False,
+            "error": f"無法讀取題庫檔案 {xlsx_path} ：{e}",
+            "bank": [],
+            "debug_cols": [],
+            "report": {}
+        }
+
+    def norm(s):
+        return str(s).strip().lower()
+
+    cols_norm = {norm(c): c for c in df.columns}
+
+    name_candidates = ["name", "中文", "名稱", "chinese", "cn"]
+    eng_candidates  = ["english", "英文", "term", "英文名", "en", "english term"]
+    sym_candidates  = ["symbol", "符號", "元素符號", "符號symbol", "abbrev", "代號", "符號/代號"]
+
+    def pick_col(cands):
+        for cand in cands:
+            if cand in cols_norm:
+                return cols_norm[cand]
+        return None
+
+    name_col = pick_col(name_candidates)
+    eng_col  = pick_col(eng_candidates)
+    sym_col  = pick_col(sym_candidates)
+
+    if name_col is None or eng_col is None or sym_col is None:
+        return {
+            "ok": False,
+            "error": (
+                "找不到必要欄位。\n"
+                f"目前檔案欄位是：{list(df.columns)}\n"
+                f"Name欄候選：{name_candidates}\n"
+                f"English欄候選：{eng_candidates}\n"
+                f"Symbol欄候選：{sym_candidates}\n"
+                "請把 Excel 欄位命名成其中一個候選名稱（例如：Name / English / Symbol）。"
+            ),
+            "bank": [],
+            "debug_cols": list(df.columns),
+            "report": {}
+        }
+
+    def clean(x):
+        if pd.isna(x):
+            return ""
+        return str(x).strip()
+
+    # 直接取整欄 list，不用 iterrows（大題庫差很多）；Excel 列號 = index + 2（第 1 列是標題）
+    rows = zip(
+        range(2, len(df) + 2),
+        map(clean, df[name_col].tolist()),
+        map(clean, df[eng_col].tolist()),
+        map(clean, df[sym_col].tolist()),
+    )
+    bank_list, report = validate_question_bank(rows)
+
+    return {
+        "ok": True,
+        "error": "",
+        "bank": bank_list,
+        "debug_cols": list(df.columns),
+        "report": report
+    }
+
+
+# ===================== 題幹 / 正解 / 干擾選項 =====================
+def question_prompt_text(q, submode_code):
+    """三種問法的題幹文字"""
+    if submode_code == "name_to_eng":
+        return f'「{q["name"].strip()}」的正確英文是？'
+    elif submode_code == "eng_to_sym":
+        return f'「{q["english"].strip()}」對應的正確符號(Symbol)是？'
+    else:  # "sym_to_eng"
+        return f'符號「{q["symbol"].strip()}」的正確英文名稱是？'
+
+
+def pick_round_items(available, k, rng=random):
+    """從可用的題庫 index 抽 k 題（不夠 k 題就全部打亂）"""
+    if len(available) <= k:
+        chosen = list(available)
+        rng.shuffle(chosen)
+        return chosen
+    return rng.sample(available, k)
+
+
+def submode_quotas(k, history=(), rng=random, past_stats=None):
+    """
+    把 k 題平均分給三種問法（差最多 1 題）；
+    除不盡的名額優先給「弱項」：歷史正確率最低、其次作答最少（沒作答過算最弱）。
+    history:    這一局的 (qidx, submode_code, is_correct)
+    past_stats: 之前幾局累計的 {submode_code: (作答數, 答對數)}
+    """
+    past_stats = past_stats or {}
+    answered = {sm: past_stats.get(sm, (0, 0))[0] for sm in SUBMODES}
+    correct = {sm: past_stats.get(sm, (0, 0))[1] for sm in SUBMODES}
+    for _, submode_code, is_correct in history:
+        if submode_code in answered:
+            answered[submode_code] += 1
+            correct[submode_code] += 1 if is_correct else 0
+
+    order = list(SUBMODES)
+    rng.shuffle(order)      # 同分時不要永遠偏向同一種
+    order.sort(key=lambda sm: (
+        correct[sm] / answered[sm] if answered[sm] else -1.0,
+        answered[sm],
+    ))
+
+    base, extra = divmod(k, len(SUBMODES))
+    return {sm: base + (1 if i < extra else 0) for i, sm in enumerate(order)}
+
+
+def compose_mixed_round(available, k, history=(), rng=random, past_stats=None):
+    """
+    混合模式的一回合：同時決定抽哪些題、每題用哪種問法。
+      - 三種問法題數平均（見 submode_quotas，弱項多分 1 題；弱項看 history + past_stats）
+      - 同一題、同一種問法不跟之前的回合重複（history 裡出現過的 (qidx, submode) 不再用）
+
+    做法：先抽 2k 個候選題，再做「候選題 -> 問法名額」的二分圖匹配（增廣路徑），
+    候選題只有 O(k) 個、問法只有 3 種，一般情況和題庫大小無關。
+    2k 個候選湊不滿時，再把 available 其餘的題（隨機順序）逐一拿來匹配，直到湊滿為止；
+    這一步最差要掃過整個 available，但只在候選題不夠用時才會發生。
+    整個 available 都試過還湊不滿（題庫太小、組合都用過了），才放寬「不重複」的限制補滿。
+
+    回傳 (題庫 index 清單, 對應的問法清單)，順序已打亂
+    """
+    history = list(history)
+    k = min(k, len(available))
+    quotas = submode_quotas(k, history, rng, past_stats)
+    used = {(qidx, sm) for qidx, sm, _ in history}
+
+    candidates = pick_round_items(available, min(len(available), 2 * k), rng)
+    allowed = {
+        qidx: [sm for sm in SUBMODES if (qidx, sm) not in used]
+        for qidx in candidates
+    }
+    holders = {sm: [] for sm in SUBMODES}     # 問法 -> 已分到這個問法的題
+    assigned = {}                             # 題 -> 問法
+
+    def augment(qidx, seen):
+        options = allowed[qidx][:]
+        rng.shuffle(options)
+        for sm in options:
+            if sm in seen or not quotas[sm]:
+                continue
+            seen.add(sm)
+            if len(holders[sm]) < quotas[sm]:
+                holders[sm].append(qidx)
+                assigned[qidx] = sm
+                return True
+            for other in holders[sm]:
+                if augment(other, seen):
+                    holders[sm].remove(other)
+                    holders[sm].append(qidx)
+                    assigned[qidx] = sm
+                    return True
+        return False
+
+    # 可選問法越少的題越先配，比較不會卡住
+    for qidx in sorted(candidates, key=lambda i: len(allowed[i])):
+        if len(assigned) >= k:
+            break
+        augment(qidx, set())
+
+    # 候選題湊不滿 -> 試 available 裡其餘的題
+    if len(assigned) < k and len(available) > len(candidates):
+        candidate_set = set(candidates)
+        rest = [i for i in available if i not in candidate_set]
+        rng.shuffle(rest)
+        for qidx in rest:
+            if len(assigned) >= k:
+                break
+            allowed[qidx] = [sm for sm in SUBMODES if (qidx, sm) not in used]
+            if allowed[qidx]:
+                augment(qidx, set())
+
+    # 湊不滿 -> 用剩下的候選題補空的名額（此時一定會違反「不重複」）
+    leftovers = [i for i in candidates if i not in assigned]
+    for sm in SUBMODES:
+        while len(holders[sm]) < quotas[sm] and leftovers:
+            qidx = leftovers.pop()
+            holders[sm].append(qidx)
+            assigned[qidx] = sm
+
+    pairs = list(assigned.items())
+    rng.shuffle(pairs)
+    return [qidx for qidx, _ in pairs], [sm for _, sm in pairs]
+
+
+def answer_field(submode_code):
+    """選項 / 正解用的欄位：eng_to_sym 選 Symbol，其他選 English"""
+    return "symbol" if submode_code == "eng_to_sym" else "english"
+
+
+def pick_distractor(bank, correct_value, field, rng=random, max_tries=32):
+    """
+    從題庫隨機抽一個和正解不同（忽略大小寫）的值。
+    先隨機試幾次（平均 O(1)），試不到才整個掃一遍；
+    兩種做法都是在「值不同的題目」中均勻抽，機率分布一樣。
+    """
+    if not bank:
+        return "???"
+    correct_key = correct_value.lower()
+    for _ in range(max_tries):
+        val = bank[rng.randrange(len(bank))][field].strip()
+        if val.lower() != correct_key:
+            return val
+    pool = [
+        it[field].strip()
+        for it in bank
+        if it[field].strip().lower() != correct_key
+    ]
+    return rng.choice(pool) if pool else "???"
+
+
+def build_options(bank, qidx, submode_code, rng=random):
+    """
+    submode_code:
+      "name_to_eng":     題目顯示 Name,   選 English
+      "eng_to_sym":      題目顯示 English,選 Symbol
+      "sym_to_eng":      題目顯示 Symbol, 選 English
+
+    回傳 (正解, [兩個選項，已打亂])
+    """
+    field = answer_field(submode_code)
+    correct = bank[qidx][field].strip()
+    opts = [correct, pick_distractor(bank, correct, field, rng)]
+    rng.shuffle(opts)
+    return correct, opts